@@ -2,13 +2,22 @@
 import os
 import tempfile
 import streamlit as st
-from huggingface_hub import snapshot_download
 from PIL import Image, ImageDraw, ImageFont
 import sys
 import shutil
 import traceback
-
-from subtitle_core import extract_audio, transcribe, render_subtitled_video, _wrap_text
+import gc
+import hashlib
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import accumulate
+
+from subtitle_core import (
+    extract_audio, load_whisper_model, transcribe, render_subtitled_video, hex_to_rgba as parse_hex_color,
+    draw_rounded_rectangle, text_mask, stamp_text, draw_text_outline, measure_text, measure_bbox, _wrap_text,
+    available_video_encoders
+)
 from srt_tools import to_srt, from_srt
 
 # --------------------- CONFIG ---------------------
@@ -22,6 +31,10 @@ st.markdown("""
 models_dir = "models"
 os.makedirs(models_dir, exist_ok=True)
 
+# Let huggingface_hub's Xet backend use all cores and parallel connections for model downloads.
+# Read when huggingface_hub is first imported, which only happens lazily below.
+os.environ.setdefault("HF_XET_HIGH_PERFORMANCE", "1")
+
 ALL_MODELS = {
     "tiny.en": "Systran/faster-whisper-tiny.en",
     "base.en": "Systran/faster-whisper-base.en",
@@ -29,35 +42,108 @@ ALL_MODELS = {
     "medium.en": "Systran/faster-whisper-medium.en",
 }
 
+COMPUTE_TYPES = ["auto", "int8", "int8_float16", "float16"]
+
+# Output resolutions offered for rendering, as the shorter side of the frame; None keeps the source resolution
+OUTPUT_RESOLUTIONS = {"Original": None, "1080p": 1080, "720p": 720, "480p": 480}
+
+# Minimum time, in seconds, between redraws of the render log
+LOG_FLUSH_INTERVAL = 0.25
+
+# The only files faster-whisper loads; skips READMEs and any other weights in the repos
+MODEL_FILES = ["config.json", "preprocessor_config.json", "model.bin", "tokenizer.json", "vocabulary.*"]
+
 # --------------------- MODEL SELECTION ---------------------
+@st.cache_data(ttl=60, show_spinner=False)
+def resolve_model_path(model_name):
+    """
+    Returns the directory holding a model's files, or None if it hasn't been downloaded.
+    Models ship in models/<name>; downloads live in the standard Hugging Face cache, which
+    other Whisper apps on the machine share. Earlier downloads cached under models/ still count.
+    """
+    from huggingface_hub import try_to_load_from_cache
+
+    bundled_path = os.path.join(models_dir, model_name)
+    if os.path.isdir(bundled_path):
+        return bundled_path
+    for cache_dir in (None, models_dir):
+        # model.bin is the largest file, so it is the last one to land in a complete download
+        cached_file = try_to_load_from_cache(ALL_MODELS[model_name], "model.bin", cache_dir=cache_dir)
+        if isinstance(cached_file, str):
+            return os.path.dirname(cached_file)
+    return None
+
 def is_model_downloaded(model_name):
-    return os.path.isdir(os.path.join(models_dir, model_name))
+    return resolve_model_path(model_name) is not None
+
+def fetch_model(model_name):
+    """Downloads a model's files into the Hugging Face cache. Runs off the script thread."""
+    from huggingface_hub import snapshot_download
+
+    # The 'token' parameter is no longer necessary for public models.
+    # Downloading into the shared cache (rather than local_dir) stores each file once, with no copies
+    snapshot_download(
+        repo_id=ALL_MODELS[model_name],
+        local_files_only=False,
+        allow_patterns=MODEL_FILES,
+        max_workers=8
+    )
+
+@st.cache_resource
+def model_downloads():
+    """Downloads in flight, shared by every session so each model is only fetched once at a time."""
+    return {"executor": ThreadPoolExecutor(max_workers=1), "futures": {}}
+
+def is_model_downloading(model_name):
+    future = model_downloads()["futures"].get(model_name)
+    return future is not None and not future.done()
 
 def download_model(model_name):
-    repo_id = ALL_MODELS[model_name]
-    
-    # Remove the token-related code
-    # token = st.secrets.get("huggingface", {}).get("token")
-    # if not token:
-    #     st.error("Hugging Face API token not found in Streamlit secrets.")
-    #     return
-    
-    # os.environ["HUGGINGFACEHUB_API_TOKEN"] = token # This line is no longer needed
-    
-    with st.spinner(f"📥 Downloading {model_name}..."):
-        try:
-            # The 'token' parameter is no longer necessary for public models
-            snapshot_download(
-                repo_id=repo_id,
-                local_dir=os.path.join(models_dir, model_name),
-                local_files_only=False
-            )
-            st.success(f"✅ {model_name} downloaded!")
-        except Exception as e:
-            st.error(f"Failed to download model {model_name}: {e}")
+    downloads = model_downloads()
+    if not is_model_downloading(model_name):
+        downloads["futures"][model_name] = downloads["executor"].submit(fetch_model, model_name)
+    # Each session only reports on the downloads it asked for, even when another session started them
+    st.session_state.pending_downloads.add(model_name)
+
+@st.fragment(run_every=1)
+def download_status():
+    """Polls this session's downloads once a second and refreshes the page when one finishes."""
+    futures = model_downloads()["futures"]
+    finished = False
+    for model_name in sorted(st.session_state.pending_downloads):
+        future = futures[model_name]
+        if not future.done():
+            if future.running():
+                st.info(f"📥 Downloading {model_name}… You can keep styling in the meantime.")
+            else:
+                st.info(f"🕒 Queued {model_name}, it will download after the current model.")
+            continue
+        st.session_state.pending_downloads.discard(model_name)
+        finished = True
+        if future.exception():
+            st.session_state.download_notice = ("error", f"Failed to download model {model_name}: {future.exception()}")
+        else:
+            st.session_state.download_notice = ("success", f"✅ {model_name} downloaded!")
+    if finished:
+        resolve_model_path.clear()
+        st.rerun()
+
+@st.cache_resource(max_entries=1, show_spinner=False)
+def get_whisper_model(model_path, compute_type, cpu_threads):
+    """Keeps the loaded Whisper model in memory across reruns and regenerations."""
+    return load_whisper_model(model_path, compute_type, cpu_threads)
+
+def select_model(model_name):
+    if model_name != st.session_state.selected_model:
+        # Drop the previously loaded model before the next one is loaded so RAM isn't doubled
+        get_whisper_model.clear()
+        gc.collect()
+    st.session_state.selected_model = model_name
 
 if "selected_model" not in st.session_state:
     st.session_state.selected_model = "tiny.en"
+if "pending_downloads" not in st.session_state:
+    st.session_state.pending_downloads = set()
 
 st.markdown("### 🧠 Select Whisper Model")
 st.markdown("Using online or RAM > 6GB, and can wait 3x times more than `small.en`? Use `medium.en` for 95% subtitles' accuracy. Else choose `small.en` for subtitles' accuracy is about 80% ")
@@ -66,11 +152,18 @@ cols = st.columns(len(ALL_MODELS))
 for i, (name, _) in enumerate(ALL_MODELS.items()):
     if is_model_downloaded(name):
         if cols[i].button(f"✅ {name}", key=f"select_{name}"):
-            st.session_state.selected_model = name
+            select_model(name)
+    elif is_model_downloading(name):
+        cols[i].button(f"⏳ {name}", key=f"dl_{name}", disabled=True)
     else:
         if cols[i].button(f"📥 {name}", key=f"dl_{name}"):
             download_model(name)
             st.rerun()
+if st.session_state.pending_downloads:
+    download_status()
+if "download_notice" in st.session_state:
+    notice_kind, notice_text = st.session_state.pop("download_notice")
+    getattr(st, notice_kind)(notice_text)
 st.markdown(f"**Current Model:** `{st.session_state.selected_model}`")
 
 # --------------------- SESSION STATE INITIALIZATION ---------------------
@@ -86,16 +179,22 @@ for key, default in {
     "active_outline_color": "#000000", "active_outline_opacity": 100,
     "active_outline_thickness": 2, "disable_active_style": True,
     "original_video_path": None, "original_transcript": None,
-    "srt_content": "", "temp_dirs": [], "generated_video_path": None,
+    "srt_content": "", "rendered_job": None, "temp_dirs": [], "generated_video_path": None,
     "uploaded_video": None, "selected_font": "Arial.ttf",
-    "selected_style_key": None
+    "selected_style_key": None, "compute_type": "auto",
+    "batch_size": 8, "beam_size": 5, "cpu_threads": os.cpu_count() or 1,
+    "video_encoder": "libx264", "output_resolution": "Original"
 }.items():
     if key not in st.session_state:
         st.session_state[key] = default
 
 # --------------------- FONT SELECTION ---------------------
-font_files = [f for f in os.listdir("fonts") if f.endswith((".ttf", ".otf"))]
-font_files.insert(0, "Arial.ttf")
+@st.cache_data(ttl=300, show_spinner=False)
+def list_font_files():
+    """Bundled fonts, rescanned at most every five minutes rather than on every rerun."""
+    return ["Arial.ttf"] + sorted(f for f in os.listdir("fonts") if f.endswith((".ttf", ".otf")))
+
+font_files = list_font_files()
 
 try:
     font_index = font_files.index(st.session_state.selected_font)
@@ -104,56 +203,109 @@ except ValueError:
 
 # --------------------- SIDEBAR CONTROLS ---------------------
 st.sidebar.header("Subtitle Customization")
-with st.sidebar.expander("General Settings"):
-    st.session_state.word_case = st.selectbox(
-        "Word Case",
-        ["As Is", "UPPERCASE", "lowercase", "Title Case"],
-        index=["As Is", "UPPERCASE", "lowercase", "Title Case"].index(st.session_state.word_case),
-        key="word_case_selectbox"
+# Style widgets live in a form so the app only reruns (and redraws the preview) when "Apply" is pressed
+with st.sidebar.form("style_form"):
+    with st.expander("General Settings"):
+        st.session_state.word_case = st.selectbox(
+            "Word Case",
+            ["As Is", "UPPERCASE", "lowercase", "Title Case"],
+            index=["As Is", "UPPERCASE", "lowercase", "Title Case"].index(st.session_state.word_case),
+            key="word_case_selectbox"
+        )
+        st.session_state.selected_font = st.selectbox(
+            "Font Style",
+            font_files,
+            index=font_index,
+            key="font_style_selectbox"
+        )
+        st.session_state.font_size = st.slider("Font Size (px)", 20, 100, value=st.session_state.font_size, key="font_size_slider")
+        st.session_state.y_position_percent = st.slider("Vertical Position (%)", 0, 100, value=st.session_state.y_position_percent, key="y_position_slider")
+        st.session_state.x_offset = st.slider("Horizontal Offset", -300, 300, value=st.session_state.x_offset, key="x_offset_slider")
+        st.session_state.subtitle_area_width_percent = st.slider("Subtitle Width (%)", 50, 100, value=st.session_state.subtitle_area_width_percent, key="subtitle_width_slider")
+
+    with st.expander("Normal Style"):
+        st.session_state.normal_font_color = st.color_picker("Text Color", st.session_state.normal_font_color, key="normal_color_picker")
+        st.session_state.normal_opacity = st.slider("Opacity (%)", 0, 100, value=st.session_state.normal_opacity, key="normal_opacity_slider")
+        st.session_state.bg_color = st.color_picker("Background", st.session_state.bg_color, key="bg_color_picker")
+        st.session_state.bg_opacity = st.slider("BG Opacity (%)", 0, 100, value=st.session_state.bg_opacity, key="bg_opacity_slider")
+        st.session_state.bg_border_radius = st.slider("BG Border Radius (px)", 0, 50, value=st.session_state.bg_border_radius, key="bg_radius_slider")
+        st.session_state.normal_outline_color = st.color_picker("Outline Color", st.session_state.normal_outline_color, key="normal_outline_color_picker")
+        st.session_state.normal_outline_opacity = st.slider("Outline Opacity", 0, 100, value=st.session_state.normal_outline_opacity, key="normal_outline_opacity_slider")
+        st.session_state.normal_outline_thickness = st.slider("Outline Thickness", 0, 10, value=st.session_state.normal_outline_thickness, key="normal_outline_thickness_slider")
+
+    with st.expander("Active Word Style"):
+        st.session_state.disable_active_style = st.checkbox("Disable Active Style", value=st.session_state.disable_active_style)
+        st.session_state.active_font_color = st.color_picker("Active Text Color", st.session_state.active_font_color, key="active_color_picker")
+        st.session_state.active_opacity = st.slider("Active Opacity (%)", 0, 100, value=st.session_state.active_opacity, key="active_opacity_slider")
+        st.session_state.size_scale = st.slider("Size Scale", 0.5, 2.0, value=st.session_state.size_scale, step=0.05, key="size_scale_slider")
+        st.session_state.active_bg_color = st.color_picker("Active BG Color", st.session_state.active_bg_color, key="active_bg_color_picker")
+        st.session_state.active_bg_opacity = st.slider("Active BG Opacity", 0, 100, value=st.session_state.active_bg_opacity, key="active_bg_opacity_slider")
+        st.session_state.active_bg_border_radius = st.slider("Active BG Border Radius (px)", 0, 50, value=st.session_state.active_bg_border_radius, key="active_bg_radius_slider")
+        st.session_state.active_outline_color = st.color_picker("Active Border", st.session_state.active_outline_color, key="active_outline_color_picker")
+        st.session_state.active_outline_opacity = st.slider("Active Outline Opacity", 0, 100, value=st.session_state.active_outline_opacity, key="active_outline_opacity_slider")
+        st.session_state.active_outline_thickness = st.slider("Active Thickness", 0, 10, value=st.session_state.active_outline_thickness, key="active_outline_thickness_slider")
+
+    st.form_submit_button("Apply", use_container_width=True)
+
+with st.sidebar.expander("Transcription"):
+    st.session_state.compute_type = st.selectbox(
+        "Compute Type",
+        COMPUTE_TYPES,
+        index=COMPUTE_TYPES.index(st.session_state.compute_type),
+        help="auto uses float16 on an NVIDIA GPU and int8 on CPU. Types the device can't run fall back to int8.",
+        key="compute_type_selectbox"
+    )
+    st.session_state.batch_size = st.slider(
+        "Batch Size", 1, 16, value=st.session_state.batch_size,
+        help="Chunks of speech decoded in parallel. 1 transcribes sequentially.",
+        key="batch_size_slider"
+    )
+    st.session_state.beam_size = st.slider(
+        "Beam Size", 1, 5, value=st.session_state.beam_size,
+        help="1 decodes greedily: fastest, with slightly lower accuracy.",
+        key="beam_size_slider"
     )
-    st.session_state.selected_font = st.selectbox(
-        "Font Style",
-        font_files,
-        index=font_index,
-        key="font_style_selectbox"
+    max_threads = os.cpu_count() or 1
+    if max_threads > 1:
+        st.session_state.cpu_threads = st.slider(
+            "CPU Threads", 1, max_threads, value=min(st.session_state.cpu_threads, max_threads),
+            help="Threads Whisper uses on CPU. Lower it to leave cores free for other work.",
+            key="cpu_threads_slider"
+        )
+
+with st.sidebar.expander("Rendering"):
+    encoders = available_video_encoders()
+    st.session_state.video_encoder = st.selectbox(
+        "Encoder",
+        encoders,
+        index=encoders.index(st.session_state.video_encoder) if st.session_state.video_encoder in encoders else 0,
+        help="Hardware encoders (NVENC, Quick Sync, VideoToolbox) offload H.264 encoding to the GPU. Only encoders that work on this machine are listed.",
+        key="video_encoder_selectbox"
+    )
+    st.session_state.output_resolution = st.selectbox(
+        "Output Resolution",
+        list(OUTPUT_RESOLUTIONS),
+        index=list(OUTPUT_RESOLUTIONS).index(st.session_state.output_resolution),
+        help="Rendering smaller than the source is faster. Subtitle styles are scaled to match; videos are never upscaled.",
+        key="output_resolution_selectbox"
     )
-    st.session_state.font_size = st.slider("Font Size (px)", 20, 100, value=st.session_state.font_size, key="font_size_slider")
-    st.session_state.y_position_percent = st.slider("Vertical Position (%)", 0, 100, value=st.session_state.y_position_percent, key="y_position_slider")
-    st.session_state.x_offset = st.slider("Horizontal Offset", -300, 300, value=st.session_state.x_offset, key="x_offset_slider")
-    st.session_state.subtitle_area_width_percent = st.slider("Subtitle Width (%)", 50, 100, value=st.session_state.subtitle_area_width_percent, key="subtitle_width_slider")
-
-with st.sidebar.expander("Normal Style"):
-    st.session_state.normal_font_color = st.color_picker("Text Color", st.session_state.normal_font_color, key="normal_color_picker")
-    st.session_state.normal_opacity = st.slider("Opacity (%)", 0, 100, value=st.session_state.normal_opacity, key="normal_opacity_slider")
-    st.session_state.bg_color = st.color_picker("Background", st.session_state.bg_color, key="bg_color_picker")
-    st.session_state.bg_opacity = st.slider("BG Opacity (%)", 0, 100, value=st.session_state.bg_opacity, key="bg_opacity_slider")
-    st.session_state.bg_border_radius = st.slider("BG Border Radius (px)", 0, 50, value=st.session_state.bg_border_radius, key="bg_radius_slider")
-    st.session_state.normal_outline_color = st.color_picker("Outline Color", st.session_state.normal_outline_color, key="normal_outline_color_picker")
-    st.session_state.normal_outline_opacity = st.slider("Outline Opacity", 0, 100, value=st.session_state.normal_outline_opacity, key="normal_outline_opacity_slider")
-    st.session_state.normal_outline_thickness = st.slider("Outline Thickness", 0, 10, value=st.session_state.normal_outline_thickness, key="normal_outline_thickness_slider")
-
-with st.sidebar.expander("Active Word Style"):
-    st.session_state.disable_active_style = st.checkbox("Disable Active Style", value=st.session_state.disable_active_style)
-    st.session_state.active_font_color = st.color_picker("Active Text Color", st.session_state.active_font_color, key="active_color_picker")
-    st.session_state.active_opacity = st.slider("Active Opacity (%)", 0, 100, value=st.session_state.active_opacity, key="active_opacity_slider")
-    st.session_state.size_scale = st.slider("Size Scale", 0.5, 2.0, value=st.session_state.size_scale, step=0.05, key="size_scale_slider")
-    st.session_state.active_bg_color = st.color_picker("Active BG Color", st.session_state.active_bg_color, key="active_bg_color_picker")
-    st.session_state.active_bg_opacity = st.slider("Active BG Opacity", 0, 100, value=st.session_state.active_bg_opacity, key="active_bg_opacity_slider")
-    st.session_state.active_bg_border_radius = st.slider("Active BG Border Radius (px)", 0, 50, value=st.session_state.active_bg_border_radius, key="active_bg_radius_slider")
-    st.session_state.active_outline_color = st.color_picker("Active Border", st.session_state.active_outline_color, key="active_outline_color_picker")
-    st.session_state.active_outline_opacity = st.slider("Active Outline Opacity", 0, 100, value=st.session_state.active_outline_opacity, key="active_outline_opacity_slider")
-    st.session_state.active_outline_thickness = st.slider("Active Thickness", 0, 10, value=st.session_state.active_outline_thickness, key="active_outline_thickness_slider")
 
 # --------------------- RECOMMENDED STYLES BUTTONS ---------------------
 st.markdown("---")
 st.sidebar.header("Recommended Styles")
 
+@st.cache_resource(show_spinner=False)
+def style_thumbnail(style_key):
+    """PNG bytes of a Recommended Style thumbnail, read from disk once and served as-is."""
+    with open(os.path.join("styles", f"{style_key}.png"), "rb") as f:
+        return f.read()
+
 # Style 1
 if "selected_style_key" in st.session_state and st.session_state.selected_style_key == "style1":
     with st.success("Selected"):
-        st.sidebar.image(os.path.join("styles", "style1.png"), use_container_width=True)
+        st.sidebar.image(style_thumbnail("style1"), use_container_width=True)
 else:
-    st.sidebar.image(os.path.join("styles", "style1.png"), use_container_width=True)
+    st.sidebar.image(style_thumbnail("style1"), use_container_width=True)
 if st.sidebar.button("Apply Style 1"):
     st.session_state.update({
         "selected_font": "Exo-Black.otf",
@@ -171,9 +323,9 @@ if st.sidebar.button("Apply Style 1"):
 # Style 2
 if "selected_style_key" in st.session_state and st.session_state.selected_style_key == "style2":
     with st.success("Selected"):
-        st.sidebar.image(os.path.join("styles", "style2.png"), use_container_width=True)
+        st.sidebar.image(style_thumbnail("style2"), use_container_width=True)
 else:
-    st.sidebar.image(os.path.join("styles", "style2.png"), use_container_width=True)
+    st.sidebar.image(style_thumbnail("style2"), use_container_width=True)
 if st.sidebar.button("Apply Style 2"):
     st.session_state.update({
         "selected_font": "Baloo-Regular.ttf",
@@ -191,9 +343,9 @@ if st.sidebar.button("Apply Style 2"):
 # Style 3
 if "selected_style_key" in st.session_state and st.session_state.selected_style_key == "style3":
     with st.success("Selected"):
-        st.sidebar.image(os.path.join("styles", "style3.png"), use_container_width=True)
+        st.sidebar.image(style_thumbnail("style3"), use_container_width=True)
 else:
-    st.sidebar.image(os.path.join("styles", "style3.png"), use_container_width=True)
+    st.sidebar.image(style_thumbnail("style3"), use_container_width=True)
 if st.sidebar.button("Apply Style 3"):
     st.session_state.update({
         "selected_font": "AmaticSC-Regular.ttf",
@@ -212,28 +364,11 @@ if st.sidebar.button("Apply Style 3"):
 
 # --------------------- LIVE PREVIEW ---------------------
 def hex_to_rgba(hex_color, alpha_percent):
-    hex_color = hex_color.lstrip('#')
     try:
-        r, g, b = int(hex_color[0:2], 16), int(hex_color[2:4], 16), int(hex_color[4:6], 16)
-        a = int(255 * (alpha_percent / 100.0))
-        return (r, g, b, a)
-    except (ValueError, IndexError):
+        return parse_hex_color(hex_color, alpha_percent)
+    except ValueError:
         return (0, 0, 0, 0)
 
-def draw_rounded_rectangle(draw_context, xy, radius, fill=None, outline=None):
-    x0, y0, x1, y1 = xy
-    max_radius = min((x1 - x0) / 2, (y1 - y0) / 2)
-    radius = min(radius, max_radius)
-    if radius <= 0:
-        draw_context.rectangle(xy, fill=fill, outline=outline)
-        return
-    draw_context.rectangle([(x0 + radius, y0), (x1 - radius, y1)], fill=fill, outline=outline)
-    draw_context.rectangle([(x0, y0 + radius), (x1, y1 - radius)], fill=fill, outline=outline)
-    draw_context.pieslice([(x0, y0), (x0 + 2 * radius, y0 + 2 * radius)], 180, 270, fill=fill, outline=outline)
-    draw_context.pieslice([(x1 - 2 * radius, y0), (x1, y0 + 2 * radius)], 270, 360, fill=fill, outline=outline)
-    draw_context.pieslice([(x0, y1 - 2 * radius), (x0 + 2 * radius, y1)], 90, 180, fill=fill, outline=outline)
-    draw_context.pieslice([(x1 - 2 * radius, y1 - 2 * radius), (x1, y1)], 0, 90, fill=fill, outline=outline)
-
 def get_font_path(font_name):
     local_font_path = os.path.join("fonts", font_name)
     if os.path.exists(local_font_path):
@@ -248,117 +383,157 @@ def get_font_path(font_name):
     path = system_font_paths.get(sys.platform)
     return path if path and os.path.exists(path) else None
 
+@st.cache_resource(show_spinner=False)
+def load_preview_font(font_name, font_size):
+    # Keyed by name so the path lookup, like the FreeType open, happens once per (font, size)
+    return ImageFont.truetype(get_font_path(font_name), font_size)
+
 def apply_case(word_text, case_option):
     if case_option == "UPPERCASE": return word_text.upper()
     if case_option == "lowercase": return word_text.lower()
     if case_option == "Title Case": return word_text.title()
     return word_text
 
+@st.cache_data(ttl=120, max_entries=32, show_spinner=False)
 def generate_preview_image(width, height, subtitle_text, active_word_index, **kwargs):
     img = Image.new("RGB", (width, height), "white")
-    overlay = Image.new("RGBA", (width, height), (0, 0, 0, 0))
-    overlay_draw = ImageDraw.Draw(overlay)
 
-    font_path = get_font_path(kwargs.get("selected_font", "Arial.ttf"))
+    font_name = kwargs.get("selected_font", "Arial.ttf")
     font_size = kwargs.get("font_size", 48)
 
     try:
-        normal_font = ImageFont.truetype(font_path, int(font_size))
-        active_font = ImageFont.truetype(font_path, int(font_size * kwargs['size_scale']))
+        normal_font = load_preview_font(font_name, int(font_size))
+        active_font = load_preview_font(font_name, int(font_size * kwargs['size_scale']))
     except (IOError, TypeError):
-        st.warning(f"Could not load font: {font_path}. Using default font.")
+        # The warning is shown by the caller, as Streamlit calls in here would be replayed on cache hits
         normal_font = ImageFont.load_default()
         active_font = ImageFont.load_default()
 
     max_subtitle_width_pixels = int(width * (kwargs['subtitle_area_width_percent'] / 100.0))
-    words_data = [{"word": w, "start": 0, "end": 0} for w in subtitle_text.split()]
-    wrapped_lines_data = _wrap_text(words_data, max_subtitle_width_pixels, normal_font, kwargs['word_case'], overlay_draw)
+    # Case is applied once per word; wrapping, measuring and drawing all reuse the cased text
+    words_data = [{"word": apply_case(w, kwargs['word_case']), "start": 0, "end": 0} for w in subtitle_text.split()]
+    wrapped_lines_data = _wrap_text(words_data, max_subtitle_width_pixels, normal_font, "As Is")
 
     line_height_estimate = normal_font.size * 1.2
     total_text_height = len(wrapped_lines_data) * line_height_estimate
     y_pos_pixels = height - int(height * (kwargs['y_position_percent'] / 100.0))
     y_pos_block_start = y_pos_pixels - (total_text_height // 2)
 
-    max_line_width = 0
+    # Measure every word once; the same advances are used for block width, centering and drawing
+    space_width = measure_text(normal_font, " ")
+    line_texts = []
+    line_widths = []
     for line in wrapped_lines_data:
-        line_width = sum(overlay_draw.textlength(apply_case(word['word'], kwargs['word_case']) + " ", font=normal_font) for word in line) - overlay_draw.textlength(" ", font=normal_font)
-        if line_width > max_line_width:
-            max_line_width = line_width
+        texts = [word['word'] for word in line]
+        line_texts.append(texts)
+        line_widths.append(sum(measure_text(normal_font, text + " ") for text in texts) - space_width)
+    max_line_width = max(line_widths, default=0)
 
     x_pos_block_start = (width // 2 + kwargs['x_offset']) - (max_line_width // 2)
     padding = 10
     bg_rect = (x_pos_block_start - padding, y_pos_block_start - (0.5 * padding),
                x_pos_block_start + max_line_width + padding, y_pos_block_start + total_text_height + (1.75 * padding))
 
-    if kwargs['bg_opacity'] > 0:
-        draw_rounded_rectangle(overlay_draw, bg_rect, kwargs['bg_border_radius'], fill=hex_to_rgba(kwargs['bg_color'], kwargs['bg_opacity']))
-
+    # Colors only depend on the style settings, so resolve them once rather than per word
+    use_active_style = not kwargs.get('disable_active_style')
+    normal_fill_rgba = hex_to_rgba(kwargs['normal_font_color'], kwargs['normal_opacity'])
+    normal_border_rgba = hex_to_rgba(kwargs['normal_outline_color'], kwargs['normal_outline_opacity'])
+    active_fill_rgba = hex_to_rgba(kwargs['active_font_color'], kwargs['active_opacity'])
+    active_border_rgba = hex_to_rgba(kwargs['active_outline_color'], kwargs['active_outline_opacity'])
+    active_bg_rgba = hex_to_rgba(kwargs['active_bg_color'], kwargs['active_bg_opacity'])
+    draw_active_bg = kwargs['active_bg_opacity'] > 0
+    active_bg_radius = kwargs['active_bg_border_radius']
+    normal_style = (normal_font, normal_fill_rgba, normal_border_rgba, kwargs['normal_outline_thickness'])
+    active_style = (active_font, active_fill_rgba, active_border_rgba, kwargs['active_outline_thickness'])
+    active_bg_pad = measure_text(active_font, " ") * 0.5
+
+    # Layout pass: resolve every word's text, position and style into flat parallel lists
+    word_texts, word_xs, word_ys, word_active = [], [], [], []
     current_line_y = y_pos_block_start + padding
-    word_counter = 0
-
-    for line in wrapped_lines_data:
-        line_width_for_centering = sum(overlay_draw.textlength(apply_case(word['word'], kwargs['word_case']) + " ", font=normal_font) for word in line) - overlay_draw.textlength(" ", font=normal_font)
-        current_word_x = (width // 2 + kwargs['x_offset']) - (line_width_for_centering // 2)
+    for texts, line_width_for_centering in zip(line_texts, line_widths):
+        line_start_x = (width // 2 + kwargs['x_offset']) - (line_width_for_centering // 2)
+        active = [use_active_style and (len(word_texts) + i == active_word_index) for i in range(len(texts))]
+        advances = [measure_text(active_font if is_active else normal_font, text + " ") for text, is_active in zip(texts, active)]
+        word_xs.extend(accumulate(advances[:-1], initial=line_start_x))
+        word_ys.extend([current_line_y] * len(texts))
+        word_texts.extend(texts)
+        word_active.extend(active)
+        current_line_y += line_height_estimate
 
-        for word_data in line:
-            is_active = (word_counter == active_word_index)
-            rendered_word_text = apply_case(word_data['word'], kwargs['word_case'])
-            word_font = active_font if is_active and not kwargs.get('disable_active_style') else normal_font
-            
-            fill_color_rgba = hex_to_rgba(kwargs['active_font_color'] if is_active and not kwargs.get('disable_active_style') else kwargs['normal_font_color'],
-                                         kwargs['active_opacity'] if is_active and not kwargs.get('disable_active_style') else kwargs['normal_opacity'])
-            
-            border_color_rgba = hex_to_rgba(kwargs['active_outline_color'] if is_active and not kwargs.get('disable_active_style') else kwargs['normal_outline_color'],
-                                            kwargs['active_outline_opacity'] if is_active and not kwargs.get('disable_active_style') else kwargs['normal_outline_opacity'])
-            
-            border_thickness = kwargs['active_outline_thickness'] if is_active and not kwargs.get('disable_active_style') else kwargs['normal_outline_thickness']
-
-            if is_active and not kwargs.get('disable_active_style') and kwargs['active_bg_opacity'] > 0:
-                word_bbox = overlay_draw.textbbox((current_word_x, current_line_y), rendered_word_text, font=word_font)
-                space_width = (overlay_draw.textlength(" ", font=word_font)) * 0.5
-                bg_rect_word = (word_bbox[0] - space_width, word_bbox[1] - space_width,
-                                word_bbox[2] + space_width, word_bbox[3] + space_width)
-                draw_rounded_rectangle(overlay_draw, bg_rect_word, kwargs['active_bg_border_radius'], fill=hex_to_rgba(kwargs['active_bg_color'], kwargs['active_bg_opacity']))
-
-            if border_thickness > 0:
-                for x_offset_outline in range(-border_thickness, border_thickness + 1):
-                    for y_offset_outline in range(-border_thickness, border_thickness + 1):
-                        if x_offset_outline != 0 or y_offset_outline != 0:
-                            overlay_draw.text((current_word_x + x_offset_outline, current_line_y + y_offset_outline),
-                                              rendered_word_text, font=word_font, fill=border_color_rgba)
-            
-            overlay_draw.text((current_word_x, current_line_y), rendered_word_text, font=word_font, fill=fill_color_rgba)
-            current_word_x += overlay_draw.textlength(rendered_word_text + " ", font=word_font)
-            word_counter += 1
+    # Size the overlay to the area the subtitles can touch (background box, glyphs plus outline,
+    # active-word highlight) instead of the whole canvas, and draw into it with shifted coordinates
+    extents = [bg_rect] if kwargs['bg_opacity'] > 0 else []
+    for rendered_word_text, x, y, is_active in zip(word_texts, word_xs, word_ys, word_active):
+        word_font, _, _, border_thickness = active_style if is_active else normal_style
+        left, top, right, bottom = measure_bbox(word_font, rendered_word_text)
+        margin = max(border_thickness, active_bg_pad if is_active else 0) + 2
+        extents.append((x + left - margin, y + top - margin, x + right + margin, y + bottom + margin))
+    if not extents:
+        return img
+    origin_x = math.floor(min(e[0] for e in extents))
+    origin_y = math.floor(min(e[1] for e in extents))
+    overlay = Image.new("RGBA", (math.ceil(max(e[2] for e in extents)) - origin_x + 1,
+                                 math.ceil(max(e[3] for e in extents)) - origin_y + 1), (0, 0, 0, 0))
+    overlay_draw = ImageDraw.Draw(overlay)
 
-        current_line_y += line_height_estimate
+    if kwargs['bg_opacity'] > 0:
+        draw_rounded_rectangle(overlay_draw, (bg_rect[0] - origin_x, bg_rect[1] - origin_y, bg_rect[2] - origin_x, bg_rect[3] - origin_y),
+                               kwargs['bg_border_radius'], fill=hex_to_rgba(kwargs['bg_color'], kwargs['bg_opacity']))
+
+    # Draw pass
+    for rendered_word_text, x, y, is_active in zip(word_texts, word_xs, word_ys, word_active):
+        x -= origin_x
+        y -= origin_y
+        word_font, fill_color_rgba, border_color_rgba, border_thickness = active_style if is_active else normal_style
+        if is_active and draw_active_bg:
+            left, top, right, bottom = measure_bbox(word_font, rendered_word_text)
+            bg_rect_word = (x + left - active_bg_pad, y + top - active_bg_pad, x + right + active_bg_pad, y + bottom + active_bg_pad)
+            draw_rounded_rectangle(overlay_draw, bg_rect_word, active_bg_radius, fill=active_bg_rgba)
+
+        if border_thickness > 0:
+            draw_text_outline(overlay, word_font, rendered_word_text, (x, y), border_color_rgba, border_thickness)
+        stamp_text(overlay, *text_mask(word_font, rendered_word_text, (x, y)), fill_color_rgba)
+
+    # The base canvas is opaque, so a masked paste of the overlay is equivalent to alpha compositing
+    img.paste(overlay, (origin_x, origin_y), overlay)
+    return img
+
+# A fragment, so toggling the preview reruns only this block rather than the whole page.
+# Style changes still rerun everything, but those arrive once per "Apply" from the sidebar form.
+@st.fragment
+def live_preview():
+    st.subheader("Live Subtitle Preview")
+    st.markdown("This shows a sample of how your subtitles will look. Change the **Subtitle Width** to see the text wrap automatically.")
+    preview_cols = st.columns([0.6, 0.4])
+    preview_h_params = {
+        "word_case": st.session_state.word_case, "y_position_percent": st.session_state.y_position_percent, "x_offset": st.session_state.x_offset,
+        "subtitle_area_width_percent": st.session_state.subtitle_area_width_percent, "font_size": st.session_state.font_size / 2,
+        "normal_font_color": st.session_state.normal_font_color, "normal_opacity": st.session_state.normal_opacity, "bg_color": st.session_state.bg_color,
+        "bg_opacity": st.session_state.bg_opacity, "bg_border_radius": st.session_state.bg_border_radius, "normal_outline_color": st.session_state.normal_outline_color,
+        "normal_outline_opacity": st.session_state.normal_outline_opacity, "normal_outline_thickness": st.session_state.normal_outline_thickness,
+        "active_font_color": st.session_state.active_font_color, "active_opacity": st.session_state.active_opacity, "size_scale": st.session_state.size_scale,
+        "active_bg_color": st.session_state.active_bg_color, "active_bg_opacity": st.session_state.active_bg_opacity,
+        "active_bg_border_radius": st.session_state.active_bg_border_radius, "active_outline_color": st.session_state.active_outline_color,
+        "active_outline_opacity": st.session_state.active_outline_opacity, "active_outline_thickness": st.session_state.active_outline_thickness,
+        "disable_active_style": st.session_state.disable_active_style, "selected_font": st.session_state.selected_font
+    }
+    # Define a common height for both images
+    common_height = 360
+    # Unchecking skips the preview entirely; while on, identical settings are served from generate_preview_image's cache
+    if st.checkbox("Live preview", value=True, key="live_preview_checkbox"):
+        with preview_cols[0]:
+            st.markdown("#### Horizontal Video Preview")
+            # Generate horizontal image with 16:9 aspect ratio
+            horizontal_width = int(common_height * (16 / 9)) # 640
+            try:
+                # Same font and size as generate_preview_image's normal font, so the check is a cache hit
+                load_preview_font(preview_h_params["selected_font"], int(preview_h_params["font_size"]))
+            except (IOError, TypeError):
+                st.warning(f"Could not load font: {st.session_state.selected_font}. Using default font.")
+            preview_horizontal = generate_preview_image(horizontal_width, common_height, "This is a sample subtitle line meow meow.", 3, **preview_h_params)
+            st.image(preview_horizontal, use_container_width=True, output_format="JPEG")
 
-    img = Image.alpha_composite(img.convert('RGBA'), overlay)
-    return img.convert("RGB")
-
-st.subheader("Live Subtitle Preview")
-st.markdown("This shows a sample of how your subtitles will look. Change the **Subtitle Width** to see the text wrap automatically.")
-preview_cols = st.columns([0.6, 0.4])
-preview_h_params = {
-    "word_case": st.session_state.word_case, "y_position_percent": st.session_state.y_position_percent, "x_offset": st.session_state.x_offset,
-    "subtitle_area_width_percent": st.session_state.subtitle_area_width_percent, "font_size": st.session_state.font_size / 2,
-    "normal_font_color": st.session_state.normal_font_color, "normal_opacity": st.session_state.normal_opacity, "bg_color": st.session_state.bg_color,
-    "bg_opacity": st.session_state.bg_opacity, "bg_border_radius": st.session_state.bg_border_radius, "normal_outline_color": st.session_state.normal_outline_color,
-    "normal_outline_opacity": st.session_state.normal_outline_opacity, "normal_outline_thickness": st.session_state.normal_outline_thickness,
-    "active_font_color": st.session_state.active_font_color, "active_opacity": st.session_state.active_opacity, "size_scale": st.session_state.size_scale,
-    "active_bg_color": st.session_state.active_bg_color, "active_bg_opacity": st.session_state.active_bg_opacity,
-    "active_bg_border_radius": st.session_state.active_bg_border_radius, "active_outline_color": st.session_state.active_outline_color,
-    "active_outline_opacity": st.session_state.active_outline_opacity, "active_outline_thickness": st.session_state.active_outline_thickness,
-    "disable_active_style": st.session_state.disable_active_style, "selected_font": st.session_state.selected_font
-}
-# Define a common height for both images
-common_height = 360
-with preview_cols[0]:
-    st.markdown("#### Horizontal Video Preview")
-    # Generate horizontal image with 16:9 aspect ratio
-    horizontal_width = int(common_height * (16 / 9)) # 640
-    preview_horizontal = generate_preview_image(horizontal_width, common_height, "This is a sample subtitle line meow meow.", 3, **preview_h_params)
-    st.image(preview_horizontal, use_container_width=True)
+live_preview()
 
 uploaded = st.file_uploader("Upload MP4 Video", type=["mp4"])
 if uploaded:
@@ -374,41 +549,88 @@ def cleanup_temp_dirs():
     st.session_state.temp_dirs = []
 
 # --------------------- GENERATE VIDEO ---------------------
+def render_settings():
+    """The style and output options passed to render_subtitled_video, read from the session."""
+    return dict(
+        selected_font=st.session_state.selected_font,
+        word_case=st.session_state.word_case, font_size=st.session_state.font_size,
+        normal_font_color=st.session_state.normal_font_color, normal_font_opacity=st.session_state.normal_opacity,
+        normal_border_color=st.session_state.normal_outline_color, normal_border_opacity=st.session_state.normal_outline_opacity,
+        normal_border_thickness=st.session_state.normal_outline_thickness, active_font_color=st.session_state.active_font_color,
+        active_font_opacity=st.session_state.active_opacity, active_word_size_scale=st.session_state.size_scale,
+        active_word_bg_color=st.session_state.active_bg_color, active_word_bg_opacity=st.session_state.active_bg_opacity,
+        active_word_bg_border_radius=st.session_state.active_bg_border_radius, active_border_color=st.session_state.active_outline_color,
+        active_border_opacity=st.session_state.active_outline_opacity, active_border_thickness=st.session_state.active_outline_thickness,
+        bg_color=st.session_state.bg_color, bg_opacity=st.session_state.bg_opacity,
+        bg_border_radius=st.session_state.bg_border_radius, y_position_percent=st.session_state.y_position_percent,
+        x_offset=st.session_state.x_offset, subtitle_area_width_percent=st.session_state.subtitle_area_width_percent,
+        disable_active_style=st.session_state.disable_active_style,
+        encoder=st.session_state.video_encoder,
+        output_resolution=OUTPUT_RESOLUTIONS[st.session_state.output_resolution]
+    )
+
 def generate_video(input_path, output_path, transcript, progress, log_area):
     logs = []
+    last_flush = [0.0]
+    def flush_logs():
+        # st.code is static text, so redraws skip the widget state a text_area carries
+        log_area.code("\n".join(logs[-20:]), language=None, height=150)
+        last_flush[0] = time.monotonic()
     def log(msg):
+        # Each redraw is a round-trip to the browser, so bursts of messages are batched
         logs.append(msg)
-        log_area.text_area("Logs", "\n".join(logs[-20:]), height=150)
+        if msg.startswith("ERROR") or time.monotonic() - last_flush[0] >= LOG_FLUSH_INTERVAL:
+            flush_logs()
     try:
-        render_subtitled_video(
-            input_path, transcript, output_path,
-            st_bar=progress, log_func=log, selected_font=st.session_state.selected_font,
-            word_case=st.session_state.word_case, font_size=st.session_state.font_size,
-            normal_font_color=st.session_state.normal_font_color, normal_font_opacity=st.session_state.normal_opacity,
-            normal_border_color=st.session_state.normal_outline_color, normal_border_opacity=st.session_state.normal_outline_opacity,
-            normal_border_thickness=st.session_state.normal_outline_thickness, active_font_color=st.session_state.active_font_color,
-            active_font_opacity=st.session_state.active_opacity, active_word_size_scale=st.session_state.size_scale,
-            active_word_bg_color=st.session_state.active_bg_color, active_word_bg_opacity=st.session_state.active_bg_opacity,
-            active_word_bg_border_radius=st.session_state.active_bg_border_radius, active_border_color=st.session_state.active_outline_color,
-            active_border_opacity=st.session_state.active_outline_opacity, active_border_thickness=st.session_state.active_outline_thickness,
-            bg_color=st.session_state.bg_color, bg_opacity=st.session_state.bg_opacity,
-            bg_border_radius=st.session_state.bg_border_radius, y_position_percent=st.session_state.y_position_percent,
-            x_offset=st.session_state.x_offset, subtitle_area_width_percent=st.session_state.subtitle_area_width_percent,
-            disable_active_style=st.session_state.disable_active_style
-        )
+        render_subtitled_video(input_path, transcript, output_path, st_bar=progress, log_func=log, **render_settings())
+        flush_logs()
         return True, output_path
     except Exception as e:
         log(f"ERROR: {e}")
+        flush_logs()
         st.error(f"An error occurred: {e}")
         traceback.print_exc()
         return False, None
     finally:
         progress.empty()
 
+def save_upload(uploaded_file, path):
+    """Streams the upload to disk in 1 MiB chunks and returns a hash of its contents."""
+    digest = hashlib.blake2b(digest_size=16)
+    uploaded_file.seek(0)
+    with open(path, "wb") as f:
+        for chunk in iter(lambda: uploaded_file.read(1024 * 1024), b""):
+            digest.update(chunk)
+            f.write(chunk)
+    return digest.hexdigest()
+
+@st.cache_data(ttl=3600, max_entries=8, show_spinner=False)
+def transcribe_upload(file_hash, model_path, compute_type, batch_size, beam_size, _cpu_threads, _video_path):
+    """
+    Extracts and transcribes an uploaded video, returning the transcript, its SRT text and the log messages.
+    Cached on the file's hash and the model settings, so re-submitting the same video to
+    try another style skips Whisper and the SRT serialization entirely. The thread count
+    doesn't change the transcript, so it is left out of the cache key.
+    Messages are collected rather than drawn: Streamlit calls made in here would be replayed
+    on cache hits against containers that no longer exist.
+    """
+    messages = []
+    # Loading the model doesn't depend on the audio, so do it while the track is decoded
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        model_future = executor.submit(get_whisper_model, model_path, compute_type, _cpu_threads)
+        audio = extract_audio(_video_path, log_func=messages.append)
+        model = model_future.result()
+    transcript = transcribe(audio, model, log_func=messages.append, batch_size=batch_size, beam_size=beam_size)
+    return transcript, to_srt(transcript), messages
+
 def handle_generation():
     if not st.session_state.get("uploaded_video"):
         st.warning("Please upload a video.")
         return
+    model_path = resolve_model_path(st.session_state.selected_model)
+    if model_path is None:
+        st.warning(f"Model {st.session_state.selected_model} isn't downloaded yet.")
+        return
 
     progress = st.progress(0)
     logs_area = st.empty()
@@ -417,27 +639,27 @@ def handle_generation():
     tmpdir = tempfile.mkdtemp()
     st.session_state.temp_dirs.append(tmpdir)
     in_path = os.path.join(tmpdir, "input.mp4")
-    audio_path = os.path.join(tmpdir, "audio.wav")
     out_path = os.path.join(tmpdir, "output.mp4")
-    model_path = os.path.join("models", st.session_state.selected_model)
 
     try:
-        with open(in_path, "wb") as f: f.write(st.session_state.uploaded_video.read())
+        file_hash = save_upload(st.session_state.uploaded_video, in_path)
         st.session_state.original_video_path = in_path
-        st.info("Extracting audio...")
-        extract_audio(in_path, audio_path, log_func=lambda m: logs_area.text_area("Log", m, height=150))
+        st.info("Extracting and transcribing audio...")
+        transcript, srt_content, messages = transcribe_upload(
+            file_hash, model_path, st.session_state.compute_type, st.session_state.batch_size, st.session_state.beam_size,
+            st.session_state.cpu_threads, in_path
+        )
+        logs_area.code("\n".join(messages[-20:]), language=None)
         progress.progress(30)
-        
-        st.info("Transcribing audio...")
-        transcript = transcribe(audio_path, model_path, log_func=lambda m: logs_area.text_area("Log", m, height=150))
         st.session_state.original_transcript = transcript
-        st.session_state.srt_content = to_srt(transcript)
+        st.session_state.srt_content = srt_content
         
         st.info("Rendering video...")
         success, final_path = generate_video(in_path, out_path, transcript, progress, logs_area)
         
         if success:
             st.session_state.generated_video_path = final_path
+            st.session_state.rendered_job = (srt_content, render_settings())
             st.success("✅ Video generated!")
             st.write("---")
             logs_area.empty()
@@ -455,7 +677,8 @@ if st.session_state.original_transcript:
     edited_srt = st.text_area("Edit below:", st.session_state.srt_content, height=300, key="srt_editor")
 
     if st.button("🔄 Regenerate with Edited SRT"):
-        if edited_srt != st.session_state.srt_content:
+        # Compare against the SRT and settings behind the video on screen, so re-submitting the same job doesn't re-render
+        if (edited_srt, render_settings()) != st.session_state.rendered_job:
             st.info("Regenerating...")
             progress = st.progress(0)
             logs_area = st.empty()
@@ -469,6 +692,7 @@ if st.session_state.original_transcript:
                 success, final_path = generate_video(st.session_state.original_video_path, new_out_path, edited_transcript, progress, logs_area)
                 if success:
                     st.session_state.generated_video_path = final_path
+                    st.session_state.rendered_job = (edited_srt, render_settings())
                     st.success("✅ Regeneration complete.")
             except Exception as e:
                 st.error(f"An error occurred during regeneration: {e}")
@@ -476,11 +700,13 @@ if st.session_state.original_transcript:
             finally:
                 logs_area.empty()
         else:
-            st.warning("No changes detected in SRT.")
+            st.warning("No changes detected in the SRT or render settings.")
 
 # --------------------- OUTPUT ---------------------
 if st.session_state.generated_video_path:
     st.subheader("Final Video")
     st.video(st.session_state.generated_video_path)
+
     with open(st.session_state.generated_video_path, "rb") as f:
-        st.download_button("💾 Download Video", f.read(), file_name=os.path.basename(st.session_state.generated_video_path))
\ No newline at end of file
+        st.download_button("💾 Download Video", f, file_name=os.path.basename(st.session_state.generated_video_path),
+                           mime="video/mp4")
\ No newline at end of file
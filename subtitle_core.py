@@ -1,18 +1,36 @@
 # subtitle_core.py
+# moviepy and faster_whisper are imported inside the functions that use them, so the
+# app can import the drawing helpers for its live preview without loading either.
 import numpy as np
-from moviepy import VideoFileClip, VideoClip
-from faster_whisper import WhisperModel
 from PIL import ImageFont, ImageDraw, Image
 from proglog import ProgressBarLogger
 import os
+import re
 import traceback
 import sys
+import math
+import multiprocessing
+import subprocess
+import threading
+from bisect import bisect_left
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from functools import lru_cache
+from itertools import accumulate
+from queue import Queue, Full
 
 # --- Helper Functions ---
 
+HAS_ROUNDED_RECTANGLE = hasattr(ImageDraw.ImageDraw, "rounded_rectangle")
+
 def draw_rounded_rectangle(draw_context, xy, radius, fill=None, outline=None):
     """Draws a rectangle with rounded corners using Pillow."""
+    # Truncated as Pillow truncates float coordinates, so edges land where the float-based drawing put them
+    xy = tuple(int(v) for v in xy)
+    if HAS_ROUNDED_RECTANGLE:
+        # Pillow >= 8.2 draws the edges and corners in one call and clamps the radius itself
+        draw_context.rounded_rectangle(xy, radius=max(radius, 0), fill=fill, outline=outline)
+        return
     x0, y0, x1, y1 = xy
     max_radius = min((x1 - x0) / 2, (y1 - y0) / 2)
     radius = min(radius, max_radius)
@@ -26,6 +44,37 @@ def draw_rounded_rectangle(draw_context, xy, radius, fill=None, outline=None):
     draw_context.pieslice([(x0, y1 - 2 * radius), (x0 + 2 * radius, y1)], 90, 180, fill=fill, outline=outline)
     draw_context.pieslice([(x1 - 2 * radius, y1 - 2 * radius), (x1, y1)], 0, 90, fill=fill, outline=outline)
 
+@lru_cache(maxsize=4096)
+def _rasterize(font, text, start, stroke_width):
+    """
+    Glyph mask cache shared by the preview and every rendered frame. A word stays on
+    screen for many consecutive frames at the same position, so almost every lookup hits.
+    """
+    try:
+        return font.getmask2(text, mode="L", start=start, stroke_width=stroke_width)
+    except AttributeError:
+        # Bitmap fonts have no getmask2 (and no stroke support)
+        return font.getmask(text, "L"), (0, 0)
+
+def text_mask(font, text, xy, stroke_width=0):
+    """
+    Rasterizes text and returns (mask, position), positioned the same way ImageDraw.text would.
+    With stroke_width the mask covers the glyphs plus FreeType's stroke around them.
+    """
+    x, y = xy
+    mask, offset = _rasterize(font, text, (math.modf(x)[0], math.modf(y)[0]), stroke_width)
+    return mask, (int(x) + offset[0], int(y) + offset[1])
+
+def stamp_text(image, mask, position, color):
+    """Fills color through a mask from text_mask onto an RGBA image."""
+    x, y = position
+    width, height = mask.size
+    image.im.paste(color, (x, y, x + width, y + height), mask)
+
+def draw_text_outline(image, font, text, xy, color, thickness):
+    """Draws a text outline with Pillow's native stroke, rasterized once per word and cached."""
+    stamp_text(image, *text_mask(font, text, xy, stroke_width=thickness), color)
+
 class StreamlitLogger(ProgressBarLogger):
     """A custom logger for moviepy that updates a Streamlit progress bar."""
     def __init__(self, st_bar, log_func):
@@ -41,17 +90,52 @@ class StreamlitLogger(ProgressBarLogger):
             self.prev_pct = pct
             self.st_bar.progress(pct)
 
+def prepare_overlay(overlay):
+    """
+    Converts an RGBA overlay into the (alpha-weighted RGB, inverse alpha) float arrays composite_overlay blends.
+    Overlays are shared by runs of identical frames, so this is done once per overlay rather than per frame.
+    """
+    overlay_region = np.asarray(overlay, dtype=np.float32)
+    alpha = overlay_region[..., 3:4] * (1 / 255.0)
+    return overlay_region[..., :3] * alpha, 1.0 - alpha
+
+def composite_overlay(frame_array, prepared, position=(0, 0)):
+    """
+    Alpha-blends an overlay prepared by prepare_overlay onto an RGB frame array with NumPy.
+    Only the area under the overlay, placed at `position`, is blended; the rest of the frame is copied as-is.
+    """
+    weighted_rgb, inverse_alpha = prepared
+    x0, y0 = position
+    y1, x1 = y0 + weighted_rgb.shape[0], x0 + weighted_rgb.shape[1]
+    result = frame_array.copy()
+    region = result[y0:y1, x0:x1]
+    # Blend in place on a single float copy of the region; same arithmetic as
+    # weighted_rgb + region * inverse_alpha + 0.5, without a temporary per operator
+    blended = region.astype(np.float32)
+    blended *= inverse_alpha
+    blended += weighted_rgb
+    blended += 0.5
+    np.copyto(region, blended, casting="unsafe")
+    return result
+
+_HEX_CACHE = {}
+_ALPHA_LUT = bytes(p * 255 // 100 for p in range(101))
+
 def hex_to_rgba(hex_color, alpha_percent):
     """Converts a hex color and alpha percentage to an RGBA tuple."""
-    hex_color = hex_color.lstrip('#')
-    try:
-        r = int(hex_color[0:2], 16)
-        g = int(hex_color[2:4], 16)
-        b = int(hex_color[4:6], 16)
-        a = int(255 * (alpha_percent / 100.0))
-        return (r, g, b, a)
-    except ValueError:
-        raise ValueError(f"Invalid hex color format: {hex_color}")
+    rgb = _HEX_CACHE.get(hex_color)
+    if rgb is None:
+        digits = hex_color.lstrip('#')[:6]
+        try:
+            rgb = tuple(bytes.fromhex(digits))
+        except ValueError:
+            rgb = ()
+        if len(rgb) != 3:
+            raise ValueError(f"Invalid hex color format: {digits}")
+        _HEX_CACHE[hex_color] = rgb
+    if type(alpha_percent) is int and 0 <= alpha_percent <= 100:
+        return rgb + (_ALPHA_LUT[alpha_percent],)
+    return rgb + (int(alpha_percent * 255 // 100),)
 
 def apply_case(word_text, case_option):
     """Applies a specific case to a word."""
@@ -64,29 +148,49 @@ def apply_case(word_text, case_option):
     return word_text
 
 @lru_cache(maxsize=32)
-def get_font(log_func, font_name, font_size):
+def _load_font(font_name, font_size):
     """
-    Finds and loads a font, caching the result.
+    Finds and loads a font, returning (font, found).
     Prioritizes a local 'fonts' directory, then system fonts.
     """
     font_path = os.path.join("fonts", font_name)
     if os.path.exists(font_path):
-        return ImageFont.truetype(font_path, font_size)
+        return ImageFont.truetype(font_path, font_size), True
 
     # Fallback to system fonts
     if sys.platform == "win32":
         system_path = os.path.join(os.environ.get("WINDIR", ""), "Fonts", font_name)
         if os.path.exists(system_path):
-            return ImageFont.truetype(system_path, font_size)
+            return ImageFont.truetype(system_path, font_size), True
     elif sys.platform == "darwin":
         system_path = os.path.join("/Library/Fonts", font_name)
         if os.path.exists(system_path):
-            return ImageFont.truetype(system_path, font_size)
-    
-    log_func(f"⚠️ Warning: Font '{font_name}' not found. Falling back to default.")
-    return ImageFont.load_default(font_size)
+            return ImageFont.truetype(system_path, font_size), True
+
+    return ImageFont.load_default(font_size), False
 
-def _wrap_text(words, max_width, font, word_case, draw_context):
+def get_font(log_func, font_name, font_size):
+    """
+    Loads a font, caching the result.
+    The cache is keyed by name and size only, so every render reuses the same font objects and
+    the measurement and mask caches keyed on them.
+    """
+    font, found = _load_font(font_name, font_size)
+    if not found:
+        log_func(f"⚠️ Warning: Font '{font_name}' not found. Falling back to default.")
+    return font
+
+@lru_cache(maxsize=8192)
+def measure_text(font, text):
+    """Memoized advance width of text. Fonts are long-lived cached objects, so they make stable keys."""
+    return font.getlength(text)
+
+@lru_cache(maxsize=4096)
+def measure_bbox(font, text):
+    """Memoized bounding box of text drawn at the origin."""
+    return font.getbbox(text)
+
+def _wrap_text(words, max_width, font, word_case):
     """
     Wraps a list of words into lines based on a max width.
     Returns a list of lines, where each line is a list of words.
@@ -94,11 +198,11 @@ def _wrap_text(words, max_width, font, word_case, draw_context):
     lines = []
     current_line = []
     current_width = 0
-    space_width = draw_context.textlength(" ", font=font)
+    space_width = measure_text(font, " ")
 
     for word_data in words:
         word_text = apply_case(word_data["word"], word_case)
-        word_width = draw_context.textlength(word_text, font=font)
+        word_width = measure_text(font, word_text)
 
         if current_line and (current_width + space_width + word_width > max_width):
             lines.append(current_line)
@@ -114,70 +218,143 @@ def _wrap_text(words, max_width, font, word_case, draw_context):
         lines.append(current_line)
     return lines
 
-@lru_cache(maxsize=128)
-def _get_text_layout(seg_tuple, max_width, font_name, font_size, word_case):
+def _get_text_layout(segment_words, max_width, font_name, font_size, word_case):
     """
-    Pre-computes the layout for a subtitle segment to avoid recalculation.
-    Using tuples for memoization cache key.
+    Pre-computes the layout for a subtitle segment once, before any frame is drawn.
+    Word measurements are cached by measure_text, so the layout itself isn't memoized.
     """
-    words = [{"word": w[0], "start": w[1], "end": w[2]} for w in seg_tuple]
+    # Case is applied once per word here; wrapping and measuring below then see the final text
+    words = [{"word": apply_case(w["word"], word_case), "start": w["start"], "end": w["end"]} for w in segment_words]
 
-    # Create temporary font and drawing context to calculate layout
     font = get_font(lambda x: None, font_name, font_size)
-    temp_img = Image.new("RGBA", (1, 1))
-    temp_draw = ImageDraw.Draw(temp_img)
-
-    lines = _wrap_text(words, max_width, font, word_case, temp_draw)
+    lines = _wrap_text(words, max_width, font, "As Is")
 
     # Pre-calculate line widths and total height
     line_layouts = []
     line_height_estimate = font.size * 1.2
     total_text_height = len(lines) * line_height_estimate
+    space_width = measure_text(font, " ")
 
     for line_words in lines:
         line_width = 0
         word_layouts = []
         for word_data in line_words:
-            word_text = apply_case(word_data["word"], word_case)
-            word_width = temp_draw.textlength(word_text, font=font)
+            word_text = word_data["word"]
+            word_width = measure_text(font, word_text)
             word_layouts.append({
                 "word": word_data,
                 "text": word_text,
                 "width": word_width
             })
-            line_width += word_width + temp_draw.textlength(" ", font=font)
+            line_width += word_width + space_width
 
-        line_width -= temp_draw.textlength(" ", font=font) if line_words else 0
+        line_width -= space_width if line_words else 0
         line_layouts.append({"words": word_layouts, "width": line_width})
 
     return line_layouts, total_text_height
 
 # --- Core Functions ---
 
-def extract_audio(video_path, audio_path, log_func):
-    """Extracts the audio from a video file and saves it as a WAV."""
+def extract_audio(video_path, log_func):
+    """
+    Decodes the audio of a video file into 16 kHz mono float32 samples, the input Whisper expects.
+    faster-whisper's PyAV decoder reads the container directly, so no intermediate WAV is written.
+    """
+    from faster_whisper.audio import decode_audio
+
     log_func("🔊 Extracting audio…")
     try:
-        clip = VideoFileClip(video_path)
-        clip.audio.write_audiofile(audio_path, codec="pcm_s16le", fps=16000)
-        clip.close()
+        audio = decode_audio(video_path, sampling_rate=16000)
         log_func("✓ Audio extracted.")
+        return audio
+    except IndexError:
+        # PyAV's way of saying the container has no audio stream
+        log_func("ERROR: Failed to extract audio: the video has no audio track.")
+        raise RuntimeError("The video has no audio track.") from None
     except Exception as e:
         log_func(f"ERROR: Failed to extract audio: {e}")
         raise
 
-def transcribe(audio_path, model_path, log_func):
-    """Transcribes an audio file using a Whisper model and returns word-level timestamps."""
+def load_whisper_model(model_path, compute_type="auto", cpu_threads=None):
+    """
+    Loads a local faster-whisper model. Callers are expected to cache the result.
+    CTranslate2 quantizes the weights at load time. "auto" picks float16 on a GPU and
+    int8 on CPU; compute types the device can't run (e.g. float16 without a GPU) fall back to int8.
+    `cpu_threads` defaults to one intra-op thread per core. GPU models are warmed up before they are returned.
+    """
+    import ctranslate2
+    from faster_whisper import WhisperModel
+
+    device = "cuda" if ctranslate2.get_cuda_device_count() > 0 else "cpu"
+    if compute_type == "auto":
+        compute_type = "float16" if device == "cuda" else "int8"
+    if compute_type not in ctranslate2.get_supported_compute_types(device):
+        compute_type = "int8"
+
+    model = WhisperModel(
+        model_path,
+        device=device,
+        compute_type=compute_type,
+        cpu_threads=cpu_threads or os.cpu_count() or 0,
+        num_workers=2,
+        local_files_only=True,
+    )
+    if device == "cuda":
+        # The first decode on a GPU pays for CUDA context and kernel setup; do it on a second of silence
+        # here, while the app is still extracting audio, instead of on the user's first transcription
+        list(model.transcribe(np.zeros(16000, dtype=np.float32), language="en", beam_size=1)[0])
+    return model
+
+# Limits for splitting the batched pipeline's segments, which span a whole VAD chunk (up to 30s),
+# back into subtitle-sized pieces like the sequential path produces
+SEGMENT_SPLIT_PAUSE = 0.5
+SEGMENT_MAX_WORDS = 20
+SEGMENT_MAX_DURATION = 8.0
+
+def _split_segment(words):
+    """
+    Splits one segment's words into subtitle-sized segments using their timestamps.
+    A segment ends after a sentence-ending word, before a pause, or once it reaches the word or duration limit.
+    """
+    segments = []
+    current = []
+    for i, word in enumerate(words):
+        if current and (len(current) >= SEGMENT_MAX_WORDS or word["end"] - current[0]["start"] > SEGMENT_MAX_DURATION):
+            segments.append(current)
+            current = []
+        current.append(word)
+        next_word = words[i + 1] if i + 1 < len(words) else None
+        if next_word and (word["word"].strip().endswith((".", "?", "!")) or next_word["start"] - word["end"] >= SEGMENT_SPLIT_PAUSE):
+            segments.append(current)
+            current = []
+    if current:
+        segments.append(current)
+    return [{"start": seg[0]["start"], "end": seg[-1]["end"], "words": seg} for seg in segments]
+
+def transcribe(audio, model, log_func, batch_size=1, beam_size=5):
+    """
+    Transcribes audio (a file path or samples from extract_audio) using a loaded Whisper model and returns word-level timestamps.
+    Silence is skipped with VAD. With batch_size > 1 the speech chunks are decoded in parallel batches,
+    and the resulting chunk-long segments are split back into subtitle-sized ones on word timestamps.
+    beam_size=1 decodes greedily, which is faster at a small cost in accuracy.
+    """
     log_func("🧠 Transcribing audio… This may take a while for longer videos.")
     try:
-        model = WhisperModel(model_path, compute_type="int8", local_files_only=True)
-        segments, _ = model.transcribe(audio_path, word_timestamps=True)
+        if batch_size > 1:
+            from faster_whisper import BatchedInferencePipeline
+
+            batched_model = BatchedInferencePipeline(model=model)
+            segments, _ = batched_model.transcribe(audio, batch_size=batch_size, beam_size=beam_size, word_timestamps=True)
+        else:
+            segments, _ = model.transcribe(audio, beam_size=beam_size, word_timestamps=True, vad_filter=True)
         transcript = [
             {"start": seg.start, "end": seg.end,
              "words": [{"word": w.word, "start": w.start, "end": w.end}
                          for w in seg.words]}
             for seg in segments
         ]
+        if batch_size > 1:
+            transcript = [piece for seg in transcript for piece in (_split_segment(seg["words"]) if seg["words"] else [seg])]
         log_func(f"✓ Transcription complete ({len(transcript)} segments).")
         return transcript
     except Exception as e:
@@ -185,6 +362,319 @@ def transcribe(audio_path, model_path, log_func):
         traceback.print_exc()
         raise
 
+# H.264 encoders moviepy can write with, mapped to the preset passed to ffmpeg for each.
+# VideoToolbox has no preset option. moviepy always passes one, so it gets moviepy's default,
+# which ffmpeg leaves unused. The hardware encoders are only listed once a test encode succeeds.
+VIDEO_ENCODER_PRESETS = {
+    "libx264": "veryfast",
+    "h264_nvenc": "p4",
+    "h264_qsv": "veryfast",
+    "h264_videotoolbox": None,
+}
+
+def _encoder_preset(encoder):
+    return VIDEO_ENCODER_PRESETS[encoder] or "medium"
+
+# Hardware encoders default to a low bitrate, so they are given one that keeps text edges sharp
+HARDWARE_ENCODER_BITRATE = "6M"
+
+# "veryfast" is several times quicker than x264's default "medium" but compresses less well, so the
+# quality target is raised one step from x264's default CRF 23 to keep output close to "medium" in quality and size
+LIBX264_CRF = "22"
+
+@lru_cache(maxsize=None)
+def available_video_encoders():
+    """
+    Returns the encoders from VIDEO_ENCODER_PRESETS that work here. ffmpeg lists hardware encoders
+    it was built with even when there is no such device, so each one is tried on a one-frame encode.
+    """
+    # imageio_ffmpeg locates the same binary moviepy uses, without importing moviepy on page load
+    from imageio_ffmpeg import get_ffmpeg_exe
+
+    try:
+        ffmpeg = get_ffmpeg_exe()
+        listing = subprocess.run([ffmpeg, "-hide_banner", "-encoders"], capture_output=True, text=True).stdout
+    except (OSError, RuntimeError):
+        return ["libx264"]
+    built = set(re.findall(r"^ V\S* (\S+)", listing, re.MULTILINE))
+
+    def encodes(name):
+        try:
+            return subprocess.run(
+                [ffmpeg, "-hide_banner", "-v", "error", "-f", "lavfi", "-i", "color=black:s=256x256:r=1:d=1",
+                 "-frames:v", "1", "-c:v", name, "-preset", _encoder_preset(name), "-f", "null", "-"],
+                capture_output=True, timeout=20,
+            ).returncode == 0
+        except (OSError, subprocess.TimeoutExpired):
+            return False
+
+    return [name for name in VIDEO_ENCODER_PRESETS if name == "libx264" or (name in built and encodes(name))]
+
+# Audio codecs that browsers play from an MP4 container, so they can be copied without re-encoding
+MP4_COPY_AUDIO_CODECS = {"aac", "mp3"}
+
+def mux_source_audio(video_path, source_path, output_path, log_func):
+    """
+    Combines the video stream of `video_path` with the first audio stream of `source_path`.
+    The audio is stream-copied when its codec plays from MP4, and re-encoded to AAC otherwise.
+    """
+    from moviepy.config import FFMPEG_BINARY
+
+    probe = subprocess.run([FFMPEG_BINARY, "-hide_banner", "-i", source_path], capture_output=True, text=True)
+    codec = re.search(r"Stream #.*?: Audio: (\w+)", probe.stderr)
+    audio_codec = "copy" if codec and codec.group(1) in MP4_COPY_AUDIO_CODECS else "aac"
+    if audio_codec != "copy":
+        log_func("Re-encoding the source audio to AAC for MP4 playback.")
+
+    cmd = [FFMPEG_BINARY, "-y", "-v", "error", "-i", video_path, "-i", source_path,
+           "-map", "0:v:0", "-map", "1:a:0", "-c:v", "copy", "-c:a", audio_codec, output_path]
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed to add the audio track: {result.stderr.strip()}")
+
+def subtitle_state(t, scene):
+    """
+    Returns what is on screen at time `t` as (segment index, indices of the active words), or None.
+    Frames with equal states get identical overlays, so the state doubles as a cache key.
+    """
+    segments = scene["segments"]
+    end_bounds = scene["segment_end_bounds"]
+    if end_bounds is None:
+        index = next((i for i, seg in enumerate(segments) if seg["start"] <= t <= seg["end"]), None)
+    else:
+        # With starts in order, the first segment whose running-max end reaches t is the first one that
+        # can contain it; it does if it has started by t
+        index = bisect_left(end_bounds, t)
+        if index == len(segments) or segments[index]["start"] > t:
+            index = None
+    if index is None:
+        return None
+    return index, tuple(i for i, (start, end) in enumerate(segments[index]["word_times"]) if start <= t <= end)
+
+def render_subtitle_overlay(t, scene):
+    """
+    Draws the subtitles visible at time `t` onto a transparent overlay.
+    Returns (overlay, position) with the overlay sized to the subtitle block, or None when nothing is on screen.
+    `scene` is the dict of precomputed layouts and styles built by render_subtitled_video.
+    """
+    state = subtitle_state(t, scene)
+    return None if state is None else draw_subtitle_state(state, scene)
+
+def draw_subtitle_state(state, scene):
+    """Draws the overlay for a state returned by subtitle_state; see render_subtitle_overlay."""
+    segment_index, active_words = state
+    current_segment = scene["segments"][segment_index]
+
+    normal_style = scene["normal_style"]
+    active_style = scene["active_style"]
+    draw_active_bg = scene["draw_active_bg"]
+    active_bg_pad = scene["active_bg_pad"]
+    x_center = scene["x_center"]
+    padding = scene["padding"]
+
+    total_text_height = current_segment["total_height"]
+    max_line_width = current_segment["max_line_width"]
+
+    x_pos_block_start = x_center - (max_line_width // 2)
+    y_pos_block_start = scene["y_center"] - (total_text_height // 2)
+
+    # Layout pass: place every word and collect the area each one can touch, so the overlay
+    # only has to cover the subtitle block rather than the whole frame
+    extents = []
+    if scene["background_rgba"] is not None:
+        bg_rect = (x_pos_block_start - padding, y_pos_block_start - (0.5 * padding),
+                   x_pos_block_start + max_line_width + padding, y_pos_block_start + total_text_height + (1.5 * padding))
+        extents.append(bg_rect)
+    placed_words = []
+    current_line_y = y_pos_block_start + padding
+    word_index = 0
+    for line in current_segment["lines"]:
+        current_word_x = x_center - (line["width"] // 2)
+        for word_layout in line["words"]:
+            rendered_word_text = word_layout["text"].strip()
+            is_active_word = word_index in active_words
+            word_index += 1
+            style = active_style if is_active_word else normal_style
+            word_font = style[0]
+            left, top, right, bottom = measure_bbox(word_font, rendered_word_text)
+            margin = max(style[3], active_bg_pad if is_active_word and draw_active_bg else 0) + 2
+            extents.append((current_word_x + left - margin, current_line_y + top - margin,
+                            current_word_x + right + margin, current_line_y + bottom + margin))
+            placed_words.append((rendered_word_text, current_word_x, current_line_y, is_active_word, style))
+            current_word_x += measure_text(word_font, rendered_word_text + " ")
+        current_line_y += scene["line_height"]
+    if not extents:
+        return None
+
+    origin_x = math.floor(min(e[0] for e in extents))
+    origin_y = math.floor(min(e[1] for e in extents))
+    subtitle_overlay = Image.new("RGBA", (math.ceil(max(e[2] for e in extents)) - origin_x + 1,
+                                          math.ceil(max(e[3] for e in extents)) - origin_y + 1), (0, 0, 0, 0))
+    overlay_draw = ImageDraw.Draw(subtitle_overlay)
+
+    if scene["background_rgba"] is not None:
+        draw_rounded_rectangle(overlay_draw, (bg_rect[0] - origin_x, bg_rect[1] - origin_y, bg_rect[2] - origin_x, bg_rect[3] - origin_y),
+                               scene["bg_radius"], fill=scene["background_rgba"])
+
+    for rendered_word_text, x, y, is_active_word, style in placed_words:
+        word_font, fill_color, border_color, border_thickness = style
+        x -= origin_x
+        y -= origin_y
+        if is_active_word and draw_active_bg:
+            left, top, right, bottom = measure_bbox(word_font, rendered_word_text)
+            draw_rounded_rectangle(overlay_draw, (x + left - active_bg_pad, y + top - active_bg_pad,
+                                                  x + right + active_bg_pad, y + bottom + active_bg_pad),
+                                   scene["active_bg_radius"], fill=scene["active_bg_rgba"])
+
+        # Both masks come from caches, so a word costs two pastes on every frame after its first
+        if border_thickness > 0:
+            draw_text_outline(subtitle_overlay, word_font, rendered_word_text, (x, y), border_color, border_thickness)
+        stamp_text(subtitle_overlay, *text_mask(word_font, rendered_word_text, (x, y)), fill_color)
+
+    # Keep only the part that lands inside the frame
+    width, height = scene["size"]
+    x0, y0 = max(origin_x, 0), max(origin_y, 0)
+    x1, y1 = min(origin_x + subtitle_overlay.width, width), min(origin_y + subtitle_overlay.height, height)
+    if x0 >= x1 or y0 >= y1:
+        return None
+    if (x0, y0, x1, y1) != (origin_x, origin_y, origin_x + subtitle_overlay.width, origin_y + subtitle_overlay.height):
+        subtitle_overlay = subtitle_overlay.crop((x0 - origin_x, y0 - origin_y, x1 - origin_x, y1 - origin_y))
+    return subtitle_overlay, (x0, y0)
+
+# Scene of the render this worker process draws overlays for, set once by the pool initializer
+_worker_scene = None
+
+def _portable_scene(scene):
+    """
+    The scene with each style's font replaced by its size, for sending to worker processes.
+    Fonts are reloaded by name there: load_default's in-memory font can't be reopened from a pickle.
+    """
+    return dict(scene, **{key: (scene[key][0].size,) + scene[key][1:] for key in ("normal_style", "active_style")})
+
+def _init_overlay_worker(scene):
+    global _worker_scene
+    _worker_scene = dict(scene, **{key: (_load_font(scene["font_name"], scene[key][0])[0],) + scene[key][1:]
+                                   for key in ("normal_style", "active_style")})
+
+def _draw_state_in_worker(state):
+    return draw_subtitle_state(state, _worker_scene)
+
+class OverlayPrefetcher:
+    """
+    Draws subtitle overlays ahead of the encoder in a pool of worker processes.
+    Overlays are requested in `frame_times` order and at most a few per worker are kept in flight,
+    so memory stays flat on long videos. Consecutive frames with the same subtitle state share one
+    drawing. Times that were not predicted are drawn in-process.
+    """
+    def __init__(self, scene, frame_times, workers):
+        # spawn rather than fork: the Streamlit server process is multi-threaded
+        self.executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_overlay_worker,
+            initargs=(_portable_scene(scene),),
+        )
+        self.scene = scene
+        self.frame_times = iter(frame_times)
+        self.pending = deque()
+        self.submitted = 0
+        self.window = workers * 4
+        self.last_state = self.last_future = None
+        self._fill()
+
+    def _fill(self):
+        # The window counts drawings rather than frames, so frames that reuse a drawing don't idle the
+        # pool; the frame cap bounds how far ahead states are looked up through long silences
+        while self.submitted < self.window and len(self.pending) < self.window * 16:
+            t = next(self.frame_times, None)
+            if t is None:
+                break
+            state = subtitle_state(t, self.scene)
+            submitted = False
+            if state is None:
+                future = None
+            elif state == self.last_state:
+                future = self.last_future
+            else:
+                future = self.executor.submit(_draw_state_in_worker, state)
+                self.last_state, self.last_future = state, future
+                submitted = True
+                self.submitted += 1
+            self.pending.append((t, future, submitted))
+
+    def _pop(self):
+        t, future, submitted = self.pending.popleft()
+        if submitted:
+            self.submitted -= 1
+        return future
+
+    def get(self, t):
+        while self.pending and self.pending[0][0] < t - 1e-9:
+            self._pop()
+        if self.pending and abs(self.pending[0][0] - t) <= 1e-9:
+            future = self._pop()
+            result = future.result() if future else None
+            self._fill()
+            return result
+        return render_subtitle_overlay(t, self.scene)
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+class FrameReadahead:
+    """
+    Reads source frames ahead of the encoder in a background thread.
+    moviepy's reader blocks the ffmpeg decoder until each frame is pulled from its pipe, so without this
+    decoding waits on compositing and encoding. Pipe reads release the GIL, so the stages overlap.
+    Frames are expected in `frame_times` order; any other request stops the thread and reads directly.
+    """
+    def __init__(self, clip, frame_times, depth=4):
+        self.clip = clip
+        self.queue = Queue(maxsize=depth)
+        self.stopped = threading.Event()
+        # moviepy reads the first frame once to size the clip and again when writing, so the last one is kept
+        self.last = (None, None)
+        self.thread = threading.Thread(target=self._read, args=(iter(frame_times),), daemon=True)
+        self.thread.start()
+
+    def _put(self, item):
+        while not self.stopped.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return
+            except Full:
+                pass
+
+    def _read(self, frame_times):
+        for t in frame_times:
+            if self.stopped.is_set():
+                return
+            try:
+                frame = self.clip.get_frame(t)
+            except Exception as e:
+                self._put((t, None, e))
+                return
+            self._put((t, frame, None))
+        self._put(None)
+
+    def get(self, t):
+        last_t, last_frame = self.last
+        if last_t is not None and abs(last_t - t) <= 1e-9:
+            return last_frame
+        if not self.stopped.is_set():
+            item = self.queue.get()
+            if item is not None and abs(item[0] - t) <= 1e-9:
+                if item[2] is not None:
+                    raise item[2]
+                self.last = item[:2]
+                return item[1]
+            self.close()
+        return self.clip.get_frame(t)
+
+    def close(self):
+        self.stopped.set()
+        self.thread.join()
+
 def render_subtitled_video(
     input_path,
     transcript,
@@ -214,13 +704,41 @@ def render_subtitled_video(
     y_position_percent=80,
     x_offset=0,
     subtitle_area_width_percent=80,
-    disable_active_style=False
+    disable_active_style=False,
+    render_workers=None,
+    encoder="libx264",
+    output_resolution=None
 ):
-    """Renders a video with dynamic subtitles based on transcription data."""
+    """
+    Renders a video with dynamic subtitles based on transcription data.
+    `output_resolution` is the target for the shorter side, as in "720p" for both landscape and portrait videos.
+    Below the source's shorter side, the video is downscaled and the pixel-based styles scaled to match.
+    """
+    from moviepy import VideoFileClip, VideoClip
+
     log_func("🎞️ Rendering subtitles and embedding audio… This is the longest step.")
     try:
         clip = VideoFileClip(input_path)
         width, height = clip.size
+        padding = 10
+        if output_resolution and output_resolution < min(width, height):
+            # ffmpeg scales while decoding, so compositing and encoding both work on the smaller frames
+            scale = output_resolution / min(width, height)
+            clip.close()
+            clip = VideoFileClip(input_path, target_resolution=(round(width * scale / 2) * 2, round(height * scale / 2) * 2))
+
+            def scaled(px):
+                return max(1, round(px * scale)) if px > 0 else 0
+
+            font_size = scaled(font_size)
+            x_offset = round(x_offset * scale)
+            normal_border_thickness = scaled(normal_border_thickness)
+            active_border_thickness = scaled(active_border_thickness)
+            active_word_bg_border_radius = scaled(active_word_bg_border_radius)
+            bg_border_radius = scaled(bg_border_radius)
+            padding = scaled(padding)
+            log_func(f"Downscaling from {width}x{height}.")
+            width, height = clip.size
         log_func(f"Video dimensions: {width}x{height}")
 
         normal_text_rgba = hex_to_rgba(normal_font_color, normal_font_opacity)
@@ -236,102 +754,121 @@ def render_subtitled_video(
         normal_font = get_font(log_func, selected_font, font_size)
         active_font = get_font(log_func, selected_font, int(font_size * active_word_size_scale))
 
+        # Everything a word's look depends on, resolved once: (font, fill, border color, border thickness)
+        normal_style = (normal_font, normal_text_rgba, normal_border_rgba, normal_border_thickness)
+        if disable_active_style:
+            active_style = normal_style
+        else:
+            active_style = (active_font, active_text_rgba, active_border_rgba, active_border_thickness)
+        draw_active_bg = not disable_active_style and active_word_bg_opacity > 0
+        active_bg_pad = measure_text(active_font, " ") * 0.5
+
         max_subtitle_width_pixels = int(width * (subtitle_area_width_percent / 100.0))
-        padding = 10
-        line_height_estimate = normal_font.size * 1.2
-        
-        # Pre-process all segments once for performance using memoized function
+
+        # Lay out each segment once up front; the word widths it needs are cached in measure_text
         processed_segments = []
         for seg in transcript:
-            seg_tuple = tuple((w["word"], w["start"], w["end"]) for w in seg["words"])
             line_layouts, total_height = _get_text_layout(
-                seg_tuple, max_subtitle_width_pixels, selected_font, font_size, word_case
+                seg["words"], max_subtitle_width_pixels, selected_font, font_size, word_case
             )
             processed_segments.append({
                 "start": seg["start"],
                 "end": seg["end"],
                 "lines": line_layouts,
+                "word_times": tuple((w["word"]["start"], w["word"]["end"]) for l in line_layouts for w in l["words"]),
                 "total_height": total_height,
                 "max_line_width": max(l["width"] for l in line_layouts) if line_layouts else 0
             })
 
+        segment_starts = [seg["start"] for seg in processed_segments]
+        scene = {
+            "size": (width, height),
+            "segments": processed_segments,
+            # Lets subtitle_state binary-search the segments; edited transcripts out of order are scanned instead
+            "segment_end_bounds": list(accumulate((seg["end"] for seg in processed_segments), max))
+                                  if segment_starts == sorted(segment_starts) else None,
+            "font_name": selected_font,
+            "normal_style": normal_style,
+            "active_style": active_style,
+            "draw_active_bg": draw_active_bg,
+            "active_bg_pad": active_bg_pad,
+            "active_bg_rgba": active_word_bg_rgba if draw_active_bg else None,
+            "active_bg_radius": active_word_bg_border_radius,
+            "background_rgba": background_rgba if bg_opacity > 0 else None,
+            "bg_radius": bg_border_radius,
+            "x_center": width // 2 + x_offset,
+            "y_center": height - int(height * (y_position_percent / 100.0)),
+            "padding": padding,
+            "line_height": normal_font.size * 1.2,
+        }
+
+        fps = getattr(clip, "fps", 24)
+        if render_workers is None:
+            render_workers = os.cpu_count() or 1
+        # moviepy asks for frames in order at frame_index / fps, so source frames can be decoded
+        # ahead in a thread and overlays drawn ahead in worker processes
+        frame_times = np.arange(0, int(clip.duration * fps)) / fps
+        # On a single core the decoder has nothing to overlap with, and the thread only adds switching
+        reader = FrameReadahead(clip, frame_times) if (os.cpu_count() or 1) > 1 else None
+        prefetcher = None
+        if render_workers > 1:
+            prefetcher = OverlayPrefetcher(scene, frame_times, render_workers)
+            log_func(f"Drawing subtitle overlays in {render_workers} worker processes.")
+
+        # Without workers, the last drawing is kept for the frames that follow with the same state
+        last_drawn = [None, None]
+        # Either way, runs of frames get the same overlay object, so its blend arrays are prepared once
+        last_prepared = [None, None]
+
         def make_frame(t):
-            frame_array = clip.get_frame(t)
-            img = Image.fromarray(frame_array).convert("RGBA")
-            subtitle_overlay = Image.new("RGBA", img.size, (0, 0, 0, 0))
-            overlay_draw = ImageDraw.Draw(subtitle_overlay)
-
-            current_segment = next((seg for seg in processed_segments if seg["start"] <= t <= seg["end"]), None)
-
-            if current_segment:
-                total_text_height = current_segment["total_height"]
-                max_line_width = current_segment["max_line_width"]
-
-                x_pos_block_start = (width // 2 + x_offset) - (max_line_width // 2)
-                y_pos_pixels = height - int(height * (y_position_percent / 100.0))
-                y_pos_block_start = y_pos_pixels - (total_text_height // 2)
-
-                bg_rect_left = x_pos_block_start - padding
-                bg_rect_right = x_pos_block_start + max_line_width + padding
-                bg_rect_top = y_pos_block_start - (0.5 * padding)
-                bg_rect_bottom = y_pos_block_start + total_text_height + (1.5 * padding)
-
-                if bg_opacity > 0:
-                    draw_rounded_rectangle(overlay_draw, (bg_rect_left, bg_rect_top, bg_rect_right, bg_rect_bottom), bg_border_radius, fill=background_rgba)
-
-                current_line_y = y_pos_block_start + padding
-                for line in current_segment["lines"]:
-                    current_word_x = (width // 2 + x_offset) - (line["width"] // 2)
-                    for word_layout in line["words"]:
-                        word_data = word_layout["word"]
-                        rendered_word_text = word_layout["text"].strip()
-                        is_active_word = (word_data["start"] <= t <= word_data["end"])
-
-                        if is_active_word and not disable_active_style:
-                            word_font = active_font
-                            fill_color = active_text_rgba
-                            border_color = active_border_rgba
-                            border_thickness = active_border_thickness
-                            if active_word_bg_opacity > 0:
-                                word_bbox = overlay_draw.textbbox((current_word_x, current_line_y), rendered_word_text, font=word_font)
-                                space_width = (overlay_draw.textlength(" ", font=word_font)) * 0.5
-                                bg_top = word_bbox[1] - space_width
-                                bg_bottom = word_bbox[3] + space_width
-                                bg_left = word_bbox[0] - space_width
-                                bg_right = word_bbox[2] + space_width
-                                draw_rounded_rectangle(overlay_draw, (bg_left, bg_top, bg_right, bg_bottom), active_word_bg_border_radius, fill=active_word_bg_rgba)
-                        else:
-                            word_font = normal_font
-                            fill_color = normal_text_rgba
-                            border_color = normal_border_rgba
-                            border_thickness = normal_border_thickness
-
-                        if border_thickness > 0:
-                            for x_offset_outline in range(-border_thickness, border_thickness + 1):
-                                for y_offset_outline in range(-border_thickness, border_thickness + 1):
-                                    if x_offset_outline != 0 or y_offset_outline != 0:
-                                        overlay_draw.text((current_word_x + x_offset_outline, current_line_y + y_offset_outline), rendered_word_text, font=word_font, fill=border_color)
-
-                        overlay_draw.text((current_word_x, current_line_y), rendered_word_text, font=word_font, fill=fill_color)
-                        current_word_x += overlay_draw.textlength(rendered_word_text + " ", font=word_font)
-
-                    current_line_y += line_height_estimate
-                
-                img = Image.alpha_composite(img, subtitle_overlay)
-            return np.array(img.convert("RGB"))
+            frame_array = reader.get(t) if reader else clip.get_frame(t)
+            if prefetcher:
+                rendered = prefetcher.get(t)
+            else:
+                state = subtitle_state(t, scene)
+                if state is None:
+                    rendered = None
+                elif state == last_drawn[0]:
+                    rendered = last_drawn[1]
+                else:
+                    rendered = draw_subtitle_state(state, scene)
+                    last_drawn[:] = state, rendered
+            if rendered is None:
+                return frame_array
+            if rendered is not last_prepared[0]:
+                last_prepared[:] = rendered, prepare_overlay(rendered[0])
+            return composite_overlay(frame_array, last_prepared[1], rendered[1])
 
         final_video_clip = VideoClip(make_frame, duration=clip.duration)
-        final_clip = final_video_clip.with_audio(clip.audio)
-        fps = getattr(clip, "fps", 24)
         logger = StreamlitLogger(st_bar, log_func)
-        final_clip.write_videofile(
-            output_path,
-            codec="libx264",
-            audio_codec="aac",
-            fps=fps,
-            logger=logger,
-        )
+        if encoder != "libx264":
+            log_func(f"Encoding with {encoder}.")
+        # Only the picture changes, so encode it on its own and copy the source audio in afterwards
+        video_only_path = os.path.splitext(output_path)[0] + ".video.mp4"
+        try:
+            final_video_clip.write_videofile(
+                video_only_path,
+                codec=encoder,
+                preset=_encoder_preset(encoder),
+                bitrate=None if encoder == "libx264" else HARDWARE_ENCODER_BITRATE,
+                ffmpeg_params=["-crf", LIBX264_CRF] if encoder == "libx264" else None,
+                threads=os.cpu_count(),
+                fps=fps,
+                audio=False,
+                logger=logger,
+            )
+        finally:
+            if reader:
+                reader.close()
+            if prefetcher:
+                prefetcher.close()
+        has_audio = clip.audio is not None
         clip.close()
+        if has_audio:
+            mux_source_audio(video_only_path, input_path, output_path, log_func)
+            os.remove(video_only_path)
+        else:
+            os.replace(video_only_path, output_path)
         log_func("✅ Subtitled video rendered.")
     except Exception as e:
         log_func(f"ERROR: Failed to render subtitled video: {e}")